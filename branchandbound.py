@@ -1,27 +1,57 @@
-from utils import FormulaAdjacencyList, FormulaClauseCounter, State
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Value
+
+from utils import FormulaAdjacencyList
+
+# Solver and shared best weight of worker process of parallel search
+_worker_solver = None
+_worker_best = None
+
+def _init_worker(solver, shared_best):
+    global _worker_solver, _worker_best
+    _worker_solver = solver
+    _worker_best = shared_best
+
+def _solve_subtree(node):
+    """ Search subtree rooted in 'node' in worker process. """
+    _worker_solver._backtrack(node, _worker_best)
+    stats = _worker_solver.stats()
+    return stats['best_weight'], stats['solution']
+
 class BranchAndBound:
     """
     Branch and bound method used for solving literal weighted SAT problem.
 
+    Variables are assigned in fixed order given by Jeroslow-Wang score,
+    variables occurring in many short clauses are branched on first.
+    Assignment is kept as integer bitmask 'values' where bit 'var' is set if
+    variable 'var' is assigned value 1. Satisfied clauses are tracked the
+    same way, bit 'c' of 'satisfied' mask is set if clause 'c' contains
+    literal that is true.
+
     Parameters
     ----------
     formula : formula.Formula
         Formula in CNF with weigths.
     """
+    # Number of nodes searched between exchanges of best weight in
+    # parallel search
+    SYNC_INTERVAL = 1024
+
     def __init__(self, formula):
         self.formula = formula
         self.adj_list = FormulaAdjacencyList(formula)
-        self.state = State(
-            assignment = {
-                var:-1
-                for var in range(1, self.formula.n_vars+1)
-            },
-            counter = FormulaClauseCounter(formula)
-        )
+        self.order = self._variable_order()
+        self.phase = self._variable_phase()
+        self.pos_mask, self.neg_mask = self._clause_masks()
+        self.decided_mask = self._decided_masks()
+        self.all_clauses = (1 << self.formula.n_clauses) - 1
+        # Below weight of any assignment, so that solution of weight 0 is
+        # not pruned
         self._stats = {
-            'best_weight':0,
-            'state': self.state
+            'best_weight':-1,
+            'solution':None,
+            'assignment':None
         }
 
     def run(self):
@@ -33,12 +63,54 @@ class BranchAndBound:
         tuple
             best_weight and its assignment
         """
-        self._backtrack( 1, sum(self.formula.weights), 0)
+        self._backtrack(self._root())
+        return self._result()
+
+    def run_parallel(self, n_workers=None, split_depth=5):
+        """
+        Run method of solver that searches subtrees in parallel.
+
+        Search tree is split into 2^split_depth subtrees rooted at depth
+        'split_depth' which are distributed to worker processes. Workers
+        share best weight found so far so that it can be used for pruning
+        by all of them.
+
+        Parameters
+        ----------
+        n_workers : int, optional
+            Number of worker processes, by default number of CPUs.
+        split_depth : int, optional
+            Depth at which the search tree is split, by default 5.
+
+        Returns
+        -------
+        tuple
+            best_weight and its assignment
+        """
+        shared_best = Value('q', self._stats['best_weight'])
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(self, shared_best)
+        ) as executor:
+            nodes = self._split(min(split_depth, self.formula.n_vars))
+            for best_weight, solution in executor.map(_solve_subtree, nodes):
+                if solution is not None and best_weight > self._stats['best_weight']:
+                    self._stats['best_weight'] = best_weight
+                    self._stats['solution'] = solution
+        return self._result()
+
+    def _result(self):
+        """ Decode best solution and return it with its score. """
+        best_weight = 0
+        if self._stats['solution'] is not None:
+            best_weight = self._stats['best_weight']
+            self._stats['assignment'] = self._decode(*self._stats['solution'])
         return (
             (
-                self._stats['best_weight'] + \
-                len(self.formula.clauses) * \
-                sum(self.formula.weights)
+                best_weight + \
+                self.formula.n_clauses * \
+                self.formula.total_weight
             ),
             self._stats['assignment']
         )
@@ -46,94 +118,246 @@ class BranchAndBound:
     def stats(self):
         return self._stats
 
-    def _backtrack(
-        self,
-        var,
-        weight_remaining,
-        current_weight
-    ):
+    def _root(self):
+        """ Return root node of search tree, no variable is assigned. """
+        return (0, self.formula.total_weight, 0, 0, 0)
+
+    def _split(self, split_depth):
+        """
+        Expand search tree down to 'split_depth' without any pruning, that is
+        done once the nodes are searched.
+
+        Returns
+        -------
+        list
+            Nodes at depth 'split_depth'.
+        """
+        nodes = [self._root()]
+        for depth in range(split_depth):
+            var = self.order[depth]
+            weight = self.formula.weights[var]
+            children = []
+            for _, weight_remaining, current_weight, satisfied, values in nodes:
+                children.append((
+                    depth + 1,
+                    weight_remaining - weight,
+                    current_weight + weight,
+                    satisfied | self.pos_mask[var],
+                    values | (1 << var)
+                ))
+                children.append((
+                    depth + 1,
+                    weight_remaining - weight,
+                    current_weight,
+                    satisfied | self.neg_mask[var],
+                    values
+                ))
+            nodes = children
+        return nodes
+
+    def _backtrack(self, root, shared_best=None):
         """
-        Backtracking method of solver
+        Backtracking method of solver.
+
+        Search tree is traversed depth first using explicit stack instead of
+        recursion. Each stack entry is a node of the tree given by tuple
+        (depth, weight_remaining, current_weight, satisfied, values) where
+        - depth is number of assigned variables, variable order[depth] will
+          be assigned to in the node,
+        - weight_remaining is sum of weights of unassigned variables,
+        - current_weight is weight of current assignment,
+        - satisfied is bitmask of clauses satisfied under current assignment,
+        - values is bitmask of variables assigned value 1.
+        Value given by 'phase' is explored first. Best solution is stored as
+        (depth, values) pair, bitmasks are immutable so no copy is needed.
 
         Parameters
         ----------
-        var : int
-            Index of variable that will be assigned to in the step of backtracking.
-        weight_remaining : Numeric type
-            Sum of weights of unassigned variables.
-        current_weight : Numeric type
-            Weight of current assignment.
-        """
-        if self._conflict():
-            return
-
-        if self._sat():
-            if current_weight > self._stats['best_weight']:
-                self._stats['best_weight'] = current_weight + weight_remaining
-                self._stats['solution'] = deepcopy(self.state)
-
-        if current_weight + weight_remaining < self._stats['best_weight']:
-            return
-
-        if var > self.formula.n_vars:
-            return
-
-        self._assign_variable(var, 0)
-        self._backtrack(
-            var + 1,
-            weight_remaining - self.formula.weights[var],
-            current_weight
-        )
-        self._unassign_variable(var)
+        root : tuple
+            Node the search starts from.
+        shared_best : multiprocessing.Value, optional
+            Best weight shared with other processes, by default None.
+            Local best weight is exchanged with it every SYNC_INTERVAL nodes
+            and whenever better solution is found.
+        """
+        n_vars = self.formula.n_vars
+        weights = self.formula.weights
+        order = self.order
+        phase = self.phase
+        pos_mask = self.pos_mask
+        neg_mask = self.neg_mask
+        decided_mask = self.decided_mask
+        all_clauses = self.all_clauses
+        best_weight = self._stats['best_weight']
+        solution = self._stats['solution']
+        # Weight of 'solution', 'best_weight' can be raised by other processes
+        solution_weight = best_weight
+        countdown = self.SYNC_INTERVAL
+        if shared_best is not None:
+            best_weight = self._sync_best(shared_best, best_weight)
 
-        self._assign_variable(var, 1)
-        self._backtrack(
-            var + 1,
-            weight_remaining - self.formula.weights[var],
-            current_weight + self.formula.weights[var]
-        )
-        self._unassign_variable(var)
-        return
-
-    def _assign_variable(self, variable, value):
-        """ Assign value to variable and update counters. """
-        self.state.assignment[variable] = value
-        for c in self.adj_list[variable][0]:
-                self.state.counter[c][int(0==value)] += 1
-        for c in self.adj_list[variable][1]:
-                self.state.counter[c][int(1==value)] += 1
-
-    def _unassign_variable(self, variable):
-        """ Unassign value from variable and update counters. """
-        value = self.state.assignment[variable]
-        self.state.assignment[variable] = -1
-        for c in self.adj_list[variable][0]:
-                self.state.counter[c][int(0==value)] -= 1
-        for c in self.adj_list[variable][1]:
-                self.state.counter[c][int(1==value)] -= 1
-
-    def _conflict(self):
+        stack = [root]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            depth, weight_remaining, current_weight, satisfied, values = pop()
+            bound = current_weight + weight_remaining
+
+            if shared_best is not None:
+                countdown -= 1
+                if not countdown:
+                    countdown = self.SYNC_INTERVAL
+                    best_weight = self._sync_best(shared_best, best_weight)
+
+            if bound <= best_weight:
+                continue
+
+            # Conflict, some fully assigned clause is not satisfied
+            if decided_mask[depth] & ~satisfied:
+                continue
+
+            # Satisfied clauses stay satisfied in whole subtree, best
+            # assignment of the subtree sets all remaining variables to 1.
+            if satisfied == all_clauses:
+                best_weight = solution_weight = bound
+                solution = (depth, values)
+                if shared_best is not None:
+                    best_weight = self._sync_best(shared_best, best_weight)
+                continue
+
+            if depth == n_vars:
+                continue
+
+            var = order[depth]
+            weight = weights[var]
+            depth += 1
+            weight_remaining -= weight
+            one = (
+                depth,
+                weight_remaining,
+                current_weight + weight,
+                satisfied | pos_mask[var],
+                values | (1 << var)
+            )
+            zero = (
+                depth,
+                weight_remaining,
+                current_weight,
+                satisfied | neg_mask[var],
+                values
+            )
+            # Preferred value is pushed last so it is explored first
+            if phase[var]:
+                push(zero)
+                push(one)
+            else:
+                push(one)
+                push(zero)
+
+        self._stats['best_weight'] = solution_weight
+        self._stats['solution'] = solution
+
+    def _sync_best(self, shared_best, best_weight):
+        """
+        Exchange local best weight with best weight shared among processes.
+
+        Returns
+        -------
+        Numeric type
+            Higher of the two weights.
+        """
+        with shared_best.get_lock():
+            if best_weight > shared_best.value:
+                shared_best.value = best_weight
+            return shared_best.value
+
+    def _variable_order(self):
+        """
+        Order variables by Jeroslow-Wang score, sum of 2^-|C| over clauses C
+        the variable occurs in, |C| is number of distinct literals of C.
+        Ties are broken by index of variable.
+
+        Returns
+        -------
+        list
+            Variables in order in which they are branched on.
+        """
+        clause_score = [2.0 ** -length for length in self.adj_list.clause_len]
+        score = [0.0] * (self.formula.n_vars + 1)
+        for var, (pos, neg) in self.adj_list:
+            score[var] = sum(clause_score[c] for c in pos) + sum(clause_score[c] for c in neg)
+        return sorted(self.formula.variables[1:], key=lambda v: -score[v])
+
+    def _variable_phase(self):
+        """
+        Choose value of each variable that is explored first. Value 1 is
+        preferred unless negated occurrences of variable outnumber
+        non-negated ones, nonzero weight counts as one more occurrence in
+        favor of value 1. Good assignments are thus found early and give
+        tight bound for pruning.
+
+        Returns
+        -------
+        list
+            Preferred value indexed by variable.
+        """
+        phase = [0] * (self.formula.n_vars + 1)
+        for var in range(1, self.formula.n_vars + 1):
+            pos = self.adj_list.pos_degree(var)
+            neg = self.adj_list.neg_degree(var)
+            phase[var] = int(pos + (self.formula.weights[var] > 0) >= neg)
+        return phase
+
+    def _clause_masks(self):
         """
         Returns
         -------
-        bool
-            Returns True if any clause is in conflict under current assignment
-            else False.
+        tuple
+            Lists 'pos_mask' and 'neg_mask' indexed by variable with bit 'c'
+            set if variable occurs in clause 'c' non-negated resp. negated.
         """
-        for i,c in enumerate(self.state.counter):
-            if c[1] == c[2]:
-                return True
-        return False
+        pos_mask = [0] * (self.formula.n_vars + 1)
+        neg_mask = [0] * (self.formula.n_vars + 1)
+        for var, (pos, neg) in self.adj_list:
+            for c in pos:
+                pos_mask[var] |= 1 << c
+            for c in neg:
+                neg_mask[var] |= 1 << c
+        return pos_mask, neg_mask
 
-    def _sat(self):
+    def _decided_masks(self):
         """
+        Variables are assigned in fixed order, clause is therefore fully
+        assigned once its last variable in the order is.
+
         Returns
         -------
-        bool
-            Returns True if formula is satisfied under current assignment else
-            False.
-        """
-        for c in self.state.counter:
-            if c[0] == 0:
-                return False
-        return True
+        list
+            Bitmasks indexed by depth with bit 'c' set if all variables of
+            clause 'c' are among first 'depth' variables of the order.
+        """
+        depth = [0] * (self.formula.n_vars + 1)
+        for d, var in enumerate(self.order):
+            depth[var] = d
+        last = [0] * (self.formula.n_vars + 1)
+        for i in range(self.formula.n_clauses):
+            last[max(map(depth.__getitem__, self.formula.clause_variables(i))) + 1] |= 1 << i
+        decided = []
+        mask = 0
+        for m in last:
+            mask |= m
+            decided.append(mask)
+        return decided
+
+    def _decode(self, depth, values):
+        """
+        Convert bitmask 'values' into assignment bytearray indexed by
+        variable, index 0 is unused, as in simulated annealing states.
+        Variables from order[depth] onwards were not branched on and are
+        assigned value 1.
+        """
+        assignment = bytearray(b'\x01' * (self.formula.n_vars+1))
+        assignment[0] = 0
+        for var in self.order[:depth]:
+            assignment[var] = (values >> var) & 1
+        return assignment
@@ -1,45 +1,41 @@
-class Literal:
+import re
+from array import array
+
+# Standalone 0 token terminating clause in DIMACS format.
+CLAUSE_END = re.compile(r'(?<!\S)0(?!\S)')
+
+class Formula:
     """
-    Literal class
+    Formula in CNF with weights of literals.
+
+    Clauses are stored in compressed (CSR) layout. Literals of all clauses
+    are concatenated into one array of signed integers as in DIMACS format,
+    negative integer is negated literal. Clause 'c' consists of literals
+    literals[clause_start[c]:clause_start[c+1]].
 
     Parameters
     ----------
-    var : int
-        Variable
-    is_negated : bool
-        True if literal is negated else False
+    variables : list
+        Variables 0..n_vars, variable 0 is not used.
+    weights : list
+        Weights of variables, weight of variable 0 is 0.
+    literals : array.array
+        Literals of all clauses.
+    clause_start : array.array
+        Offsets of clauses into 'literals' of length n_clauses + 1.
+    n_vars : int
+        Number of variables.
     """
-    def __init__(self, var, is_negated):
-        self.var = var
-        self.is_negated = is_negated
-
-    def __str__(self):
-        return self.__repr__()
-
-    def __repr__(self):
-        sign = '-' if self.is_negated else ''
-        return f'{sign}{self.var}'
-
-class Clause:
-    """ Clause representing sum of literals. """
-
-    def __init__(self, literals):
-        self.literals = literals
-        self.size = len(literals)
-
-    def __str__(self):
-        return self.__repr__()
-
-    def __repr__(self):
-        return f'Literals = {self.literals}, size = {self.size}'
-
-class Formula:
-    """ Formula in CNF with weights of literals. """
-    def __init__(self, variables, weights, clauses, n_vars):
+    def __init__(self, variables, weights, literals, clause_start, n_vars):
         self.variables = variables
         self.weights = weights
-        self.clauses = clauses
+        self.literals = literals
+        self.clause_start = clause_start
         self.n_vars = n_vars
+        self.n_clauses = len(clause_start) - 1
+        self.total_weight = sum(weights)
+        self._packed = None
+        self._variables_of = None
 
     @classmethod
     def from_file(cls, path):
@@ -57,37 +53,57 @@ class Formula:
         Formula
             Instance of Formula class
         """
-
+        body = []
         with open(path) as f:
-            clauses = []
-            clause = []
             for line in f:
                 if line.startswith('p'):
                     n_vars = int(line.split()[2])
-                    variables = [i for i in range(n_vars + 1)]
+                    variables = list(range(n_vars + 1))
                 elif line.startswith('w'):
-                    weights = [int(i.strip()) for i in line.split()[1:-1]]
-                    weights.insert(0,0)
-
+                    weights = [0]
+                    weights.extend(map(int, line.split()[1:-1]))
                 elif not line.startswith(('c','\n','%')):
-                    line = [int(i.strip()) for i in line.split()]
-                    for literal in line:
-                        if literal == 0:
-                            if clause:
-                                clauses.append(Clause(clause))
-                                clause = []
-                        else:
-                            var = abs(literal)
-                            negated = True if literal < 0 else False
-                            clause.append(Literal(var, negated))
-            if clause: # For when 0 is not after last clause in file
-                clauses.append(Clause(clause))
-        return cls(variables, weights, clauses, n_vars)
+                    body.append(line)
+
+        # Clauses are separated by 0, split whole body at once.
+        # Last clause does not need to be followed by 0.
+        literals = array('i')
+        clause_start = array('i', [0])
+        for chunk in CLAUSE_END.split(' '.join(body)):
+            clause = chunk.split()
+            if clause:
+                literals.extend(map(int, clause))
+                clause_start.append(len(literals))
+        return cls(variables, weights, literals, clause_start, n_vars)
+
+    def clause(self, c):
+        """ Return literals of clause 'c'. """
+        return self.literals[self.clause_start[c]:self.clause_start[c+1]]
+
+    def clause_variables(self, c):
+        """
+        Return variables of literals of clause 'c'. Variables of all
+        clauses are stored in one array parallel to 'literals' computed
+        once.
+        """
+        if self._variables_of is None:
+            self._variables_of = array('i', map(abs, self.literals))
+        return self._variables_of[self.clause_start[c]:self.clause_start[c+1]]
+
+    def pack(self):
+        """
+        Return literals of all clauses encoded as non-negative integers
+        2*var + neg, where 'neg' is 1 for negated literal. Clause 'c' is
+        pack()[clause_start[c]:clause_start[c+1]]. Encoding is computed once.
+        """
+        if self._packed is None:
+            self._packed = array('i', [2*-l + 1 if l < 0 else 2*l for l in self.literals])
+        return self._packed
 
     def __str__(self):
         clauses = ''
-        for clause in self.clauses:
-            clauses += f'{"".join(str(clause.literals))}\n'
+        for c in range(self.n_clauses):
+            clauses += f'{self.clause(c).tolist()}\n'
         return (
             f'# of vars: {self.n_vars}\n'
             f'Weights  :{self.weights}\n'
@@ -1,22 +1,40 @@
 from abc import ABC, abstractmethod
-from random import random, randint, choice
+from random import Random
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
 
 import math
 
 from utils import FormulaAdjacencyList, FormulaClauseCounter, State, StoppingCriterion
 
+# Solver of worker process of parallel restarts
+_worker_solver = None
+
+def _init_worker(solver):
+    global _worker_solver
+    _worker_solver = solver
+
+def _restart_in_worker(seed, temperature):
+    """ Run one restart of simulated annealing in worker process. """
+    return _worker_solver._restart(seed, temperature)
+
 class SimulatedAnnealing(ABC):
-    """ Abstract class of simulated annealing. """
+    """
+    Abstract class of simulated annealing.
+    All random numbers are drawn from generator 'self._rng' seeded by 'seed'.
+    """
     def __init__(
         self,
         iter_limit = 100,
         restart_limit = 1,
-        threshold = 1e-6
+        threshold = 1e-6,
+        seed = None
     ):
         self._iter_limit = iter_limit
         self._restart_limit = restart_limit
         self._threshold = threshold
+        self._rng = Random(seed)
         self._stats = {
             'iterations':0,
             'init':[]
@@ -69,6 +87,16 @@ class SimulatedAnnealing(ABC):
         """
         pass
 
+    def _temperatures(self, temperature):
+        """
+        Yield temperatures of consecutive iterations starting with
+        'temperature' cooled by cooling schedule.
+        """
+        cooling_schedule = self._cooling_schedule
+        while True:
+            yield temperature
+            temperature = cooling_schedule(temperature)
+
     def stop_criterion(self):
         if not self.buffer.full():
             return False
@@ -76,45 +104,122 @@ class SimulatedAnnealing(ABC):
             return True
         return False
 
-    def run(self):
-        ITER_LIMIT = self._iter_limit
-        RESTART_LIMIT = self._restart_limit
+    def run(self, n_workers=1):
+        """
+        Run simulated annealing 'restart_limit' times and return the best
+        result. Restarts are independent, each one draws random numbers from
+        generator seeded by seed drawn from 'self._rng'. Results of repeated
+        runs with fixed seed do not depend on 'n_workers'.
+
+        Parameters
+        ----------
+        n_workers : int, optional
+            Number of processes restarts are distributed to. Restarts run
+            in current process if set to 1, all processors are used if set
+            to None, by default 1.
+
+        Returns
+        -------
+        tuple
+            best_score and its state
+        """
         TEMP = self._initial_temperature()
+        seeds = [self._rng.getrandbits(64) for _ in range(self._restart_limit)]
+
+        if n_workers is None or n_workers > 1:
+            # Solver is sent to every worker once, not with every restart
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_worker,
+                initargs=(self,)
+            ) as executor:
+                results = list(
+                    executor.map(_restart_in_worker, seeds, repeat(TEMP))
+                )
+        else:
+            # Restarts reseed 'self._rng', its state is restored afterwards
+            # so that next run draws the same seeds as with workers
+            rng_state = self._rng.getstate()
+            results = list(map(self._restart, seeds, repeat(TEMP)))
+            self._rng.setstate(rng_state)
 
         best_score = 0
         best_state = None
+        for score, state, init_score, iterations in results:
+            self._stats['init'].append(init_score)
+            self._stats['iterations'] += iterations
+            if score > best_score:
+                best_score = score
+                best_state = state
+
+        return best_score, best_state
+
+    def _restart(self, seed, temperature):
+        """
+        One run of simulated annealing starting from initial state.
+
+        Parameters
+        ----------
+        seed : int
+            Seed of random number generator.
+        temperature : Numeric type
+            Initial temperature.
 
-        for _ in range(RESTART_LIMIT):
-            SIGNAL = None
-            temperature = TEMP
+        Returns
+        -------
+        tuple
+            best_score, its state, score of initial state and number of
+            iterations
+        """
+        self._rng.seed(seed)
+        ITER_LIMIT = self._iter_limit
+
+        # Methods used in every iteration are looked up once
+        random = self._rng.random
+        exp = math.exp
+        next_state_fn = self._next_state
+        evaluate = self._evaluate
+        stop_criterion = self.stop_criterion
 
-            current_state = self._initial_state()
-            current_score = self._evaluate(current_state)
-            self.buffer = StoppingCriterion(current_score, ITER_LIMIT)
-            self._stats['init'].append(current_score)
+        SIGNAL = None
+        MIN_EXPONENT = -20
+        iterations = 0
 
+        current_state = self._initial_state()
+        current_score = evaluate(current_state)
+        init_score = current_score
+        best_score = 0
+        best_state = None
+        self.buffer = StoppingCriterion(current_score, ITER_LIMIT)
+        buffer_add = self.buffer.add
 
-            while not self.stop_criterion():
+        for temperature in self._temperatures(temperature):
 
-                if SIGNAL:
-                    break
-                next_state, SIGNAL = self._next_state(current_state)
-                next_score = self._evaluate(next_state)
+            if stop_criterion() or SIGNAL:
+                break
+            next_state, SIGNAL = next_state_fn(current_state)
+            next_score = evaluate(next_state)
 
-                if  next_score > current_score or \
-                    random() < math.exp((next_score - current_score)/temperature):
-                    current_state = next_state
-                    current_score = next_score
+            # Moves that do not worsen the score are accepted without
+            # evaluating acceptance probability, exp(0) is 1 anyway. Moves
+            # with acceptance probability below exp(-20) are rejected
+            # without drawing random number.
+            delta = next_score - current_score
+            if delta >= 0 or (
+                delta > MIN_EXPONENT * temperature
+                and random() < exp(delta/temperature)
+            ):
+                current_state = next_state
+                current_score = next_score
 
-                    if current_score > best_score:
-                        best_score = current_score
-                        best_state = current_state
+                if current_score > best_score:
+                    best_score = current_score
+                    best_state = current_state
 
-                self.buffer.add(current_score)
-                temperature = self._cooling_schedule(temperature)
-                self._stats['iterations'] +=1
+            buffer_add(current_score)
+            iterations += 1
 
-        return best_score, best_state
+        return best_score, best_state, init_score, iterations
 
 
 class SA_WeightedSAT(SimulatedAnnealing):
@@ -169,7 +274,13 @@ class SA_WeightedSAT(SimulatedAnnealing):
                 its score is higher.
         - 'walksat' WalkSAT heuristic. If there are no unsat clauses, greedy
                 heuristic is used.
+
+    seed : int, optional
+        Seed of random number generator used by the solver, by default None.
     """
+    # Maximal number of precomputed temperatures of cooling schedule
+    SCHEDULE_LENGTH = 1 << 12
+
     def __init__(
         self,
         formula,
@@ -179,13 +290,15 @@ class SA_WeightedSAT(SimulatedAnnealing):
         beta = 0,
         temp_prob = 0.8,
         init_method = 'greedy',
-        next_method = 'greedy'
+        next_method = 'greedy',
+        seed = None
     ):
-        threshold = sum(formula.weights)/(formula.n_vars*iter_limit)
+        threshold = formula.total_weight/(formula.n_vars*iter_limit)
         super().__init__(
             iter_limit,
             restart_limit,
-            threshold
+            threshold,
+            seed
         )
         self.formula = formula
         self.alpha = alpha
@@ -193,9 +306,21 @@ class SA_WeightedSAT(SimulatedAnnealing):
         self.temp_prob = temp_prob
         self.init_method = init_method
         self.next_method = next_method
+        self._vars = range(1, formula.n_vars + 1)
         self.adj_list = FormulaAdjacencyList(formula)
-        self.clause_weight = sum(formula.weights) + 1
-
+        self._empty_counter = FormulaClauseCounter(formula)
+        self._occurrences = self._create_occurrences()
+        self._majority, self._majority_ties = self._create_majority()
+        self.clause_weight = formula.total_weight + 1
+        self._cached_temp = None
+        self._schedule = None
+        self._create_dispatch_tables()
+
+    def _create_dispatch_tables(self):
+        """
+        Map names of heuristics to methods implementing them and resolve
+        methods chosen by 'init_method' and 'next_method'.
+        """
         self.init_m = {
             'zero':self.__zero,
             'one':self.__one,
@@ -208,14 +333,68 @@ class SA_WeightedSAT(SimulatedAnnealing):
             'greediest':self.__greediest_next,
             'walksat':self.__walksat_next
         }
+        # Heuristics are chosen once, not on every call
+        self._initial_state_fn = self.init_m[self.init_method]
+        self._next_state_fn = self.next_m[self.next_method]
+
+    def __getstate__(self):
+        """ Bound private methods can not be pickled, drop dispatch tables. """
+        state = self.__dict__.copy()
+        del state['init_m']
+        del state['next_m']
+        del state['_initial_state_fn']
+        del state['_next_state_fn']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._create_dispatch_tables()
+
+    def _create_occurrences(self):
+        """
+        Materialize clauses of every literal from adjacency list as tuples.
+
+        Hot loops of flipping iterate these tuples instead of slicing the
+        adjacency list arrays on every call, integers are already boxed.
+        Literal of 'variable' made true by value 'val' is at index
+        2*variable + 1 - val, the opposite literal at 2*variable + val.
+        """
+        clauses = self.adj_list.clauses
+        offsets = self.adj_list.offsets
+        return [
+            tuple(clauses[offsets[i]:offsets[i+1]])
+            for i in range(len(offsets) - 1)
+        ]
+
+    def _create_majority(self):
+        """
+        Returns
+        -------
+        tuple
+            Assignment 'majority' giving every variable value of its literal
+            occurring in more clauses and tuple of variables whose literals
+            occur in the same number of clauses.
+        """
+        majority = bytearray(self.formula.n_vars+1)
+        ties = []
+        for var in self._vars:
+            non_negated = self.adj_list.pos_degree(var)
+            negated = self.adj_list.neg_degree(var)
+            if non_negated > negated:
+                majority[var] = 1
+            elif non_negated == negated:
+                ties.append(var)
+        return majority, tuple(ties)
 
     def _initial_state(self):
-        return self.init_m[self.init_method]()
+        return self._initial_state_fn()
 
     def _evaluate(self, state):
         """
         Evaluate score function. The way this score function is written,
         it first prioritizes satisfying clauses over maximizing weight.
+        Score is computed when state is created and kept up to date by
+        '_flip', evaluation only reads it.
 
         Parameters
         ----------
@@ -227,18 +406,14 @@ class SA_WeightedSAT(SimulatedAnnealing):
         int
             Value of score function.
         """
-        score = 0
-        for c in state.counter:
-            if c[0] > 0:
-                score += self.clause_weight
-        for var, val in state.assignment.items():
-            if val == 1:
-                score += self.formula.weights[var]
-        return score
+        return state.score
 
 
     def _next_state(self, current_state):
-        return self.next_m[self.next_method](current_state)
+        variable, _ = self._next_state_fn(current_state)
+        if variable is None:
+            return current_state, True
+        return self._flip(current_state.copy(), variable), None
 
     def _cooling_schedule(self, temperature):
         """
@@ -256,6 +431,95 @@ class SA_WeightedSAT(SimulatedAnnealing):
         """
         return self.alpha * temperature + self.beta
 
+    def _restart(self, seed, temperature):
+        """
+        Specialization of SimulatedAnnealing._restart. Chosen heuristic is
+        called directly, score is read from state and stopping criterion is
+        checked by single call, so that no method of solver is dispatched
+        in the loop.
+        Single state is modified in place, accepted variable is flipped
+        and rejected one is not touched at all. Best state is copied only
+        when worsening move leaves it, until then the current state is
+        the best one. Snapshot of best state is allocated once and then
+        overwritten in place.
+        """
+        self._rng.seed(seed)
+
+        random = self._rng.random
+        exp = math.exp
+        next_state_fn = self._next_state_fn
+        flip = self._flip
+        threshold = self._threshold
+
+        SIGNAL = None
+        MIN_EXPONENT = -20
+        iterations = 0
+
+        current_state = self._initial_state_fn()
+        current_score = current_state.score
+        init_score = current_score
+        best_score = 0
+        best_state = None
+        current_is_best = False
+        self.buffer = StoppingCriterion(current_score, self._iter_limit)
+        buffer_add = self.buffer.add
+        stop = self.buffer.below
+
+        for temperature in self._temperatures(temperature):
+
+            if SIGNAL or stop(threshold):
+                break
+            variable, delta = next_state_fn(current_state)
+
+            if variable is None:
+                SIGNAL = True
+            elif delta >= 0 or (
+                delta > MIN_EXPONENT * temperature
+                and random() < exp(delta/temperature)
+            ):
+                if current_is_best and delta < 0:
+                    if best_state is None:
+                        best_state = current_state.copy()
+                    else:
+                        current_state.copy_to(best_state)
+                    current_is_best = False
+                flip(current_state, variable)
+                current_score = current_state.score
+
+                if current_score > best_score:
+                    best_score = current_score
+                    current_is_best = True
+
+            buffer_add(current_score)
+            iterations += 1
+
+        if current_is_best:
+            best_state = current_state
+        return best_score, best_state, init_score, iterations
+
+    def _temperatures(self, temperature):
+        """
+        Temperatures of iterations do not depend on restart, the first
+        SCHEDULE_LENGTH of them are computed once and reused.
+        Schedule is cut short once temperature stops changing or drops to 0,
+        no worsening move is accepted since then, and the last temperature
+        is repeated.
+        """
+        if self._schedule is None or self._schedule[0] != temperature:
+            schedule = [temperature]
+            while len(schedule) < self.SCHEDULE_LENGTH and temperature > 0:
+                next_temperature = self._cooling_schedule(temperature)
+                if next_temperature == temperature:
+                    break
+                temperature = next_temperature
+                schedule.append(temperature)
+            self._schedule = schedule
+        schedule = self._schedule
+        last = schedule[-1]
+        if len(schedule) < self.SCHEDULE_LENGTH:
+            return chain(schedule, repeat(last))
+        return chain(schedule, super()._temperatures(self._cooling_schedule(last)))
+
     def _initial_temperature(self):
         """
         Initial temperature calculation is divided to 2 steps.
@@ -263,12 +527,15 @@ class SA_WeightedSAT(SimulatedAnnealing):
         moves.
         In second step calculate the temperature as if the average move in step one
         was to be accepted with 'temp_prob' probability.
+        Temperature is computed once and reused by subsequent runs.
 
         Returns
         -------
         Numeric type
             Temperature
         """
+        if self._cached_temp is not None:
+            return self._cached_temp
         #cntr = dict()
         #for var in self.formula.variables[1:]:
         #    cntr[var] = abs(len(self.adj_list[var][0]) - len(self.adj_list[var][1]))
@@ -276,10 +543,11 @@ class SA_WeightedSAT(SimulatedAnnealing):
         sum_delta = 0
         for i in range(CNT):
             st = self.__random_init()
-            nst, _ = self.__random_next(st)
-            sum_delta += abs(self._evaluate(st)-self._evaluate(nst))
+            _, delta = self.__random_next(st)
+            sum_delta += abs(delta)
         delta = sum_delta/CNT
-        return abs(delta/math.log(self.temp_prob))
+        self._cached_temp = abs(delta/math.log(self.temp_prob))
+        return self._cached_temp
 
     """
     Initial state methods
@@ -292,43 +560,37 @@ class SA_WeightedSAT(SimulatedAnnealing):
     """
     def __zero(self):
         """ Assign 0 to all variables. """
-        assignment = {var:0 for var in range(1, self.formula.n_vars+1)}
-        counter = self._compute_counter(assignment)
-        return State(assignment, counter)
+        assignment = bytearray(self.formula.n_vars+1)
+        return self._create_state(assignment)
 
     def __one(self):
         """ Assign 1 to all variables. """
-        assignment = {var:1 for var in range(1, self.formula.n_vars+1)}
-        counter = self._compute_counter(assignment)
-        return State(assignment, counter)
+        assignment = bytearray(b'\x01' * (self.formula.n_vars+1))
+        assignment[0] = 0
+        return self._create_state(assignment)
 
     def __random_init(self):
         """ Randomly assign value of 0 or 1 to variables. """
-        assignment = {var:randint(0,1) for var in range(1, self.formula.n_vars+1)}
-        counter = self._compute_counter(assignment)
-        return State(assignment, counter)
+        assignment = bytearray(self.formula.n_vars+1)
+        for var in self._vars:
+            assignment[var] = self._rng.randint(0,1)
+        return self._create_state(assignment)
 
     def __greedy_init(self):
         """
         Assign values greedily according to counts of occurances of negated
         literals and non-negated literals.
         """
-        def value(adj_list_var):
-            non_negated = len(adj_list_var[0])
-            negated = len(adj_list_var[1])
-            if non_negated != negated:
-                return 1 if non_negated > negated else 0
-            else:
-                return randint(0, 1)
-
-        assignment = {var:value(tpl) for var,tpl in self.adj_list}
-        counter = self._compute_counter(assignment)
-        return State(assignment, counter)
+        assignment = self._majority[:]
+        for var in self._majority_ties:
+            assignment[var] = self._rng.randint(0, 1)
+        return self._create_state(assignment)
 
 
     """
     Next state methods
-    Using heuristic find next state.
+    Using heuristic choose variable whose value is flipped to get next state.
+    'current_state' is not modified.
 
     Parameters
     ----------
@@ -337,128 +599,101 @@ class SA_WeightedSAT(SimulatedAnnealing):
 
     Returns
     -------
-    State
-        Instance of State class which altered current_state using heuristic
-        and neighborhood operator.
-    None or Bool-like
-        If equals to True then 1 restart will be force stopped.
+    int or None
+        Variable to be flipped or None if 1 restart is to be force stopped.
+    int or None
+        Change of score caused by the flip.
 
     """
     def __random_next(self, current_state):
         """ Randomly choose variable whose value will be flipped. """
-        next_state = current_state.copy()
-        variable = choice(list(next_state.assignment.keys()))
-        return self._flip(next_state, variable), None
+        variable = self._rng.randint(1, self.formula.n_vars)
+        delta, _ = self._best_flips(current_state, (variable,))
+        return variable, delta
 
     def __greedy_next(self, current_state):
         """ Find the best state in neighborhood of 'current_state'. """
-        next_state = current_state.copy()
-        best_score = -1
-        best_variable = 0
-        best_variables = []
-        for variable in self.formula.variables[1:]:
-            next_state = self._flip(next_state, variable)
-            score = self._evaluate(next_state)
-            next_state = self._flip(next_state, variable)
-            if score > best_score:
-                best_score = score
-                best_variable = variable
-                best_variables.clear()
-                best_variables.append(variable)
-            elif score == best_score:
-                best_variables.append(variable)
-        if best_variable:
-            return self._flip(next_state, choice(best_variables)), None
+        best_delta, best_variables = self._best_flips(current_state, self._vars)
+        if best_variables:
+            return self._rng.choice(best_variables), best_delta
         else:
-            return next_state, True
+            return None, None
 
     def __greediest_next(self, current_state):
         """
         Find the best state in neighborhood of 'current_state'.
         State has to be better than 'current_state'
         """
-        next_state = current_state.copy()
-        best_score = self._evaluate(current_state)
-        best_variable = 0
-        best_variables = []
-        for variable in self.formula.variables[1:]:
-            next_state = self._flip(next_state, variable)
-            score = self._evaluate(next_state)
-            next_state = self._flip(next_state, variable)
-            if score > best_score:
-                best_score = score
-                best_variable = variable
-                best_variables.clear()
-                best_variables.append(variable)
-            elif score == best_score:
-                best_variables.append(variable)
-        if best_variable:
-            return self._flip(next_state, choice(best_variables)), None
+        best_delta, best_variables = self._best_flips(current_state, self._vars)
+        if best_delta > 0:
+            return self._rng.choice(best_variables), best_delta
         else:
-            return current_state, True
+            return None, None
 
     def __walksat_next(self, current_state):
         """
         WalkSAT heuristic
         """
-        next_state = current_state.copy()
-        unsat_clauses = []
-        for clause in range(len(self.formula.clauses)):
-            if next_state.counter[clause][0] == 0:
-                unsat_clauses.append(clause)
+        unsat_clauses = current_state.counter.unsat_clauses
         if not unsat_clauses:
             return self.__greedy_next(current_state)
-        unsat_clause = self.formula.clauses[choice(unsat_clauses)]
-        if random() > 0.5: #random move
-            return self._flip(next_state, choice(unsat_clause.literals).var), None
+        unsat_vars = self.formula.clause_variables(self._rng.choice(unsat_clauses))
+        if self._rng.random() > 0.5: #random move
+            variable = self._rng.choice(unsat_vars)
+            delta, _ = self._best_flips(current_state, (variable,))
+            return variable, delta
         else: #greedy move
-            best_score = -1
-            best_variable = 0
-            best_variables = []
-            for literal in unsat_clause.literals:
-                next_state = self._flip(next_state, literal.var)
-                score = self._evaluate(next_state)
-                next_state = self._flip(next_state, literal.var)
-                if score > best_score:
-                    best_score = score
-                    best_variable = literal.var
-                    best_variables.clear()
-                    best_variables.append(literal.var)
-                elif score == best_score:
-                    best_variables.append(literal.var)
-            if best_variable:
-                return self._flip(next_state, choice(best_variables)), None
-            else:
-                return self._flip(next_state, choice(unsat_clause.literals).var), None
+            best_delta, best_variables = self._best_flips(current_state, unsat_vars)
+            return self._rng.choice(best_variables), best_delta
 
     """
     State manipulation methods
     """
+    def _create_state(self, assignment):
+        """
+        Create state of 'assignment' with its counter and weight.
+
+        Parameters
+        ----------
+        assignment : bytearray
+            Value 0 or 1 of variables indexed by variable, index 0 is unused.
+
+        Returns
+        -------
+        State
+            Instance of State class.
+        """
+        counter = self._compute_counter(assignment)
+        weight = sum(w for w, val in zip(self.formula.weights, assignment) if val)
+        score = counter.n_sat * self.clause_weight + weight
+        return State(assignment, counter, weight, score)
+
     def _compute_counter(self, assignment):
         """
         Adjust counter data structure to correspond to 'assignment'.
 
         Parameters
         ----------
-        assignment : Dict
-            key-value pairs where key is variable and value is 0 or 1.
+        assignment : bytearray
+            Value 0 or 1 of variables indexed by variable, index 0 is unused.
 
         Returns
         -------
         FormulaClauseCounter
             Updated counter data structure.
         """
-        counter = FormulaClauseCounter(self.formula)
-        for variable, value in assignment.items():
-            for c in self.adj_list[variable][0]:
-                counter[c][int(0==value)] += 1
-            for c in self.adj_list[variable][1]:
-                counter[c][int(1==value)] += 1
-        return counter
+        sat = self._empty_counter.sat[:]
+        occurrences = self._occurrences
+        for variable in self._vars:
+            for c in occurrences[2*variable + 1 - assignment[variable]]:
+                sat[c] += 1
+        return FormulaClauseCounter.from_sat(sat)
 
     def _flip(self, state, variable):
         """
-        Flip value of 'variable' and update counters.
+        Flip value of 'variable' and update counters including number of
+        satisfied clauses, weight and score of the state, so that the state
+        can be evaluated without rescanning clauses or variables.
 
         Parameters
         ----------
@@ -472,16 +707,78 @@ class SA_WeightedSAT(SimulatedAnnealing):
         State
             State with value of 'variable' flipped.
         """
-        new_value = int (not state.assignment[variable])
-        state.assignment[variable] = new_value
-        for c in self.adj_list[variable][0]:
-            state.counter[c][int(0==new_value)] += 1
-            state.counter[c][int(1==new_value)] -= 1
-        for c in self.adj_list[variable][1]:
-            state.counter[c][int(0==new_value)] -= 1
-            state.counter[c][int(1==new_value)] += 1
+        assignment = state.assignment
+        assignment[variable] ^= 1
+        new_value = assignment[variable]
+        sat = state.counter.sat
+        if new_value:
+            weight_change = self.formula.weights[variable]
+        else:
+            weight_change = -self.formula.weights[variable]
+        state.weight += weight_change
+        true_clauses = self._occurrences[2*variable + 1 - new_value]
+        false_clauses = self._occurrences[2*variable + new_value]
+        counter = state.counter
+        n_sat = counter.n_sat
+        for c in true_clauses:
+            count = sat[c] + 1
+            sat[c] = count
+            if count == 1:
+                n_sat += 1
+                counter.remove_unsat(c)
+        for c in false_clauses:
+            count = sat[c] - 1
+            sat[c] = count
+            if not count:
+                n_sat -= 1
+                counter.add_unsat(c)
+        state.score += (n_sat - counter.n_sat) * self.clause_weight + weight_change
+        counter.n_sat = n_sat
         return state
 
+    def _best_flips(self, state, variables):
+        """
+        Find flips of 'variables' resulting in the highest score without
+        modifying 'state'. Change of score caused by flipping variable is
+        its weight plus clause weight for every clause becoming satisfied
+        minus clause weight for every clause becoming unsatisfied.
+
+        Parameters
+        ----------
+        state : State
+            State where variables would be flipped.
+        variables : iterable
+            Integer indices of candidate variables.
+
+        Returns
+        -------
+        tuple
+            The highest change of score and list of variables, in order of
+            'variables', whose flip changes score by that much.
+        """
+        assignment = state.assignment
+        sat = state.counter.sat
+        weights = self.formula.weights
+        occurrences = self._occurrences
+        clause_weight = self.clause_weight
+        best_delta = None
+        best_variables = []
+        for variable in variables:
+            value = assignment[variable]
+            delta = -weights[variable] if value else weights[variable]
+            for c in occurrences[2*variable + value]:
+                if not sat[c]:
+                    delta += clause_weight
+            for c in occurrences[2*variable + 1 - value]:
+                if sat[c] == 1:
+                    delta -= clause_weight
+            if best_delta is None or delta > best_delta:
+                best_delta = delta
+                best_variables = [variable]
+            elif delta == best_delta:
+                best_variables.append(variable)
+        return best_delta, best_variables
+
     def eval(self, state):
         """
         Compute weight of 'state'.
@@ -496,8 +793,6 @@ class SA_WeightedSAT(SimulatedAnnealing):
         Numeric type
             Weight of assignment of 'state'.
         """
-        score = 0
-        for var, val in state.assignment.items():
-            if val == 1:
-                score += self.formula.weights[var]
-        return score
+        return sum(
+            w for w, val in zip(self.formula.weights, state.assignment) if val
+        )
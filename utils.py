@@ -1,82 +1,266 @@
-import copy
+from array import array
 from collections import deque
 
 class FormulaAdjacencyList:
-    """ Class for Adjacency list of formula. """
+    """
+    Class for Adjacency list of formula.
+
+    Indices of clauses the literals occur in are stored in compressed (CSR)
+    layout in two flat arrays. Literal of variable 'var' with polarity 'neg'
+    (0 for non-negated and 1 for negated literal) occurs in clauses
+    clauses[offsets[2*var+neg]:offsets[2*var+neg+1]], each clause is listed
+    once.
+    """
+    __slots__ = ('n_vars', 'clauses', 'offsets', 'clause_len', '_items')
+
     def __init__(self, formula):
-        self.adjacency_list = self._create_list(formula)
+        self.n_vars = formula.n_vars
+        self.clauses, self.offsets, self.clause_len = (
+            self._freeze(arr) for arr in self._create_list(formula)
+        )
+        self._items = self._create_items()
+
+    def __getstate__(self):
+        """ Memoryviews can not be pickled, arrays are pickled as bytes. """
+        return (
+            self.n_vars,
+            self.clauses.tobytes(),
+            self.offsets.tobytes(),
+            self.clause_len.tobytes()
+        )
+
+    def __setstate__(self, state):
+        self.n_vars = state[0]
+        self.clauses, self.offsets, self.clause_len = (
+            memoryview(data).cast('i') for data in state[1:]
+        )
+        self._items = self._create_items()
+
+    def __getitem__(self, var):
+        """ Return clauses of non-negated and negated literal of 'var'. """
+        clauses = self.clauses
+        offsets = self.offsets
+        pos_start = offsets[2*var]
+        neg_start = offsets[2*var+1]
+        return clauses[pos_start:neg_start], clauses[neg_start:offsets[2*var+2]]
 
-    def __getitem__(self, literal):
-        return self.adjacency_list[literal]
+    def pos_degree(self, var):
+        """ Return number of clauses non-negated literal of 'var' occurs in. """
+        return self.offsets[2*var+1] - self.offsets[2*var]
+
+    def neg_degree(self, var):
+        """ Return number of clauses negated literal of 'var' occurs in. """
+        return self.offsets[2*var+2] - self.offsets[2*var+1]
 
     def __iter__(self):
-        for k, v in self.adjacency_list.items():
-            yield k, v
+        return iter(self._items)
+
+    def _create_items(self):
+        """ Return list of pairs (var, self[var]) for every variable. """
+        # Built once so that iteration only walks over the list
+        return [(var, self[var]) for var in range(1, self.n_vars + 1)]
+
+    @staticmethod
+    def _freeze(arr):
+        """ Return read-only view of integer array 'arr'. """
+        # Instance is shared by all states and solvers of formula, its
+        # slices are views, not copies
+        return memoryview(arr.tobytes()).cast('i')
 
     def _create_list(self, formula):
-        adj_list = {var:(set(),set()) for var in formula.variables[1:]}
-        for i, clause in enumerate(formula.clauses):
-            for l in clause.literals:
-                if l.is_negated:
-                    adj_list[l.var][1].add(i)
-                else:
-                    adj_list[l.var][0].add(i)
-        return adj_list
+        occurrences = [[] for _ in range(2 * (formula.n_vars + 1))]
+        packed = formula.pack()
+        start = formula.clause_start
+        # Number of distinct literals of every clause, counted in the same pass
+        clause_len = array('i')
+        for i in range(formula.n_clauses):
+            length = 0
+            for lit in packed[start[i]:start[i+1]]:
+                lst = occurrences[lit]
+                if not lst or lst[-1] != i:
+                    lst.append(i)
+                    length += 1
+            clause_len.append(length)
+        clauses = array('i')
+        offsets = array('i', [0])
+        for lst in occurrences:
+            clauses.extend(lst)
+            offsets.append(len(clauses))
+        return clauses, offsets, clause_len
 
 class FormulaClauseCounter:
-    """ Counter of satisfied and unsatisfied literals in clauses. """
+    """
+    Counter of satisfied literals in clauses.
+
+    Counts are kept in array 'sat' indexed by clause, smallest integer type
+    able to hold length of the longest clause is used.
+    Tautological clauses, containing both literals of some variable, are
+    satisfied under any assignment. Their 'sat' count starts at 1 so that
+    no flip can make them look unsatisfied.
+    Attribute 'n_sat' holds number of clauses with at least one satisfied
+    literal and has to be kept up to date by the user of the counter.
+    Unsatisfied clauses are listed in 'unsat_clauses' in arbitrary order,
+    'unsat_index' holds position of clause in the list or -1, so that clause
+    can be added, removed or picked at random in constant time. The user
+    of the counter keeps them up to date by 'add_unsat' and 'remove_unsat'.
+    """
+    __slots__ = ('n_clauses', 'sat', 'unsat_clauses', 'unsat_index', 'n_sat')
+
     def __init__(self, formula):
-        self.counter = self._create_counter(formula)
+        self.n_clauses = formula.n_clauses
+        self.sat = self._create_sat(formula)
+        self.recount()
 
-    def __getitem__(self, clause_id):
-        return self.counter[clause_id]
+    @classmethod
+    def from_arrays(cls, sat, unsat_clauses, unsat_index, n_sat):
+        """
+        Create counter directly from its fields without scanning formula.
+        """
+        counter = cls.__new__(cls)
+        counter.n_clauses = len(sat)
+        counter.sat = sat
+        counter.unsat_clauses = unsat_clauses
+        counter.unsat_index = unsat_index
+        counter.n_sat = n_sat
+        return counter
 
-    def __iter__(self):
-        for clause in self.counter:
-            yield clause
+    def copy(self):
+        """ Copy itself. """
+        return FormulaClauseCounter.from_arrays(
+            self.sat[:],
+            self.unsat_clauses[:],
+            self.unsat_index[:],
+            self.n_sat
+        )
 
-    def _create_counter(self, formula):
-        counter = []
-        for clause in formula.clauses:
-            counter.append([0,0,clause.size])
+    def copy_to(self, counter):
+        """
+        Overwrite 'counter' of the same formula with copy of itself, its
+        buffers are reused instead of allocating new ones.
+        """
+        counter.sat[:] = self.sat
+        counter.unsat_clauses[:] = self.unsat_clauses
+        counter.unsat_index[:] = self.unsat_index
+        counter.n_sat = self.n_sat
+
+    @classmethod
+    def from_sat(cls, sat):
+        """
+        Create counter from satisfied literal counts 'sat' and compute the
+        remaining fields from them.
+        """
+        counter = cls.from_arrays(sat, None, None, 0)
+        counter.recount()
         return counter
 
+    def recount(self):
+        """ Recompute 'n_sat' and unsatisfied clauses from 'sat'. """
+        self.unsat_clauses = [c for c, count in enumerate(self.sat) if not count]
+        self.unsat_index = array('i', [-1]) * self.n_clauses
+        for i, c in enumerate(self.unsat_clauses):
+            self.unsat_index[c] = i
+        self.n_sat = self.n_clauses - len(self.unsat_clauses)
+
+    def add_unsat(self, clause):
+        """ Add 'clause' which became unsatisfied. """
+        self.unsat_index[clause] = len(self.unsat_clauses)
+        self.unsat_clauses.append(clause)
+
+    def remove_unsat(self, clause):
+        """ Remove 'clause' which became satisfied. """
+        i = self.unsat_index[clause]
+        last = self.unsat_clauses.pop()
+        if last != clause:
+            self.unsat_clauses[i] = last
+            self.unsat_index[last] = i
+        self.unsat_index[clause] = -1
+
+    def _create_sat(self, formula):
+        longest = 0
+        tautologies = []
+        packed = formula.pack()
+        start = formula.clause_start
+        for i in range(formula.n_clauses):
+            clause = set(packed[start[i]:start[i+1]])
+            longest = max(longest, len(clause))
+            tautologies.append(any(lit ^ 1 in clause for lit in clause))
+        for typecode in ('b', 'h', 'i'):
+            if longest < (1 << (8 * array(typecode).itemsize - 1)) - 1:
+                break
+        return array(typecode, tautologies)
+
 class State:
     """
     Class representing one state in search state space.
 
     Parameters
     ----------
-    assignment : dict
-        Dictionary with key value pairs, where key is variable and value
-        is truth value assigned to variable.
+    assignment : bytearray
+        Truth value 0 or 1 assigned to variable indexed by variable, index 0
+        is not used.
     counter : FormulaClauseCounter
         Counter data structure of 'assignment' used for efficient satisfied
         clause lookup.
+    weight : Numeric type, optional
+        Sum of weights of variables assigned value 1, by default 0.
+    score : Numeric type, optional
+        Value of score function of the state kept up to date by the solver,
+        by default 0.
     """
-    def __init__(self, assignment, counter):
+    __slots__ = ('assignment', 'counter', 'weight', 'score')
+
+    def __init__(self, assignment, counter, weight=0, score=0):
         self.assignment = assignment
         self.counter = counter
+        self.weight = weight
+        self.score = score
 
     def copy(self):
-        """ Copy itself. """
-        return copy.deepcopy(self)
+        """ Copy itself, assignment and counter are copied field by field. """
+        return State(
+            self.assignment[:],
+            self.counter.copy(),
+            self.weight,
+            self.score
+        )
+
+    def copy_to(self, state):
+        """
+        Overwrite 'state' of the same formula with copy of itself, buffers
+        of 'state' are reused instead of allocating new ones.
+        """
+        state.assignment[:] = self.assignment
+        self.counter.copy_to(state.counter)
+        state.weight = self.weight
+        state.score = self.score
 
 class StoppingCriterion:
     """
     Class handling stopping criterion of simulated annealing.
-    Stores last maxlen evaluation function changes.
+    Stores last maxlen evaluation function changes and their running sum.
     """
+    __slots__ = ('buffer', 'last_score', 'sum')
+
     def __init__(self, score, maxlen):
         self.buffer = deque(maxlen=maxlen)
         self.last_score = score
+        self.sum = 0
 
     def add(self, score):
-        self.buffer.append(abs(self.last_score - score))
+        change = abs(self.last_score - score)
+        if self.full():
+            self.sum -= self.buffer[0]
+        self.buffer.append(change)
+        self.sum += change
         self.last_score = score
 
     def avg(self):
-        return sum(self.buffer)/len(self.buffer)
+        return self.sum/len(self.buffer)
 
     def full(self):
-        return self.buffer.maxlen == len(self.buffer)
\ No newline at end of file
+        return self.buffer.maxlen == len(self.buffer)
+
+    def below(self, threshold):
+        """ Return True if buffer is full and average change is below threshold. """
+        buffer = self.buffer
+        return len(buffer) == buffer.maxlen and self.sum/len(buffer) < threshold